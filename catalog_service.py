@@ -5,29 +5,91 @@ Implements three endpoints:
   3. GET    /catalog/tracks        (S3) List all tracks
 """
 
+import hashlib
+import os
+import queue
+import re
 import sqlite3
-from flask import Flask, request, jsonify, g
+import threading
+import orjson
+from datetime import datetime, timezone
+from flask import Flask, request, g
 
 app = Flask(__name__)
+app.json.compact = True  # for anything still going through jsonify
 DATABASE = 'shamzam.db'
+POOL_SIZE = 8
+MMAP_SIZE = 256 * 1024 * 1024  # read the DB file through mmap, up to 256 MiB
+
+_SQL_INSERT = "INSERT INTO tracks (title, artist) VALUES (?, ?)"
+_SQL_DELETE = "DELETE FROM tracks WHERE id = ?"
+_SQL_LIST = "SELECT id, title, artist FROM tracks"
+_SQL_VERSION = "SELECT version FROM catalog_version"
+
+# Compiled once; a title or artist is valid if it has any non-blank character
+_NON_BLANK = re.compile(r"\S")
+
+# Bounded pool of SQLite connections shared by all request threads.
+# Each slot starts as None and is connected on first use.
+_POOL = queue.Queue()
+for _ in range(POOL_SIZE):
+    _POOL.put(None)
+
+# Encoded GET /catalog/tracks response, rebuilt whenever the catalogue
+# version (bumped by triggers on 'tracks') moves on.
+_LIST_CACHE = {"version": None, "etag": None, "last_modified": None, "body": None}
+_LIST_LOCK = threading.Lock()
+
+def ojson(obj, status=200):
+    """Builds a JSON response with orjson, which is much faster than jsonify."""
+    return app.response_class(orjson.dumps(obj), status=status,
+                              mimetype="application/json")
+
+def _connect():
+    """Opens a pooled connection in autocommit mode with WAL enabled."""
+    conn = sqlite3.connect(DATABASE, check_same_thread=False,
+                           isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-20000")
+    conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+    return conn
 
 def get_db():
-    """Returns a SQLite connection, stored in Flask’s 'g' context."""
+    """Returns a pooled SQLite connection, stored in Flask’s 'g' context."""
     if 'db_conn' not in g:
-        g.db_conn = sqlite3.connect(DATABASE)
-        g.db_conn.row_factory = sqlite3.Row  # so we can get columns by name
+        conn = _POOL.get()
+        if conn is None:
+            try:
+                conn = _connect()
+            except sqlite3.Error:
+                _POOL.put(None)
+                raise
+        g.db_conn = conn
     return g.db_conn
 
 @app.teardown_appcontext
 def close_db(exception):
-    """Closes the database connection at the end of each request."""
+    """Returns the database connection to the pool at the end of each request."""
     db_conn = g.pop('db_conn', None)
     if db_conn is not None:
-        db_conn.close()
+        if db_conn.in_transaction:
+            db_conn.rollback()
+        _POOL.put(db_conn)
+
+def _invalidate_list_cache():
+    """Drops the cached track list after the catalogue changes."""
+    with _LIST_LOCK:
+        _LIST_CACHE["body"] = None
 
 def init_db():
     """Creates the 'tracks' table if it doesn’t exist."""
     conn = sqlite3.connect(DATABASE)
+    # page_size only takes effect on a new database, before the first table
+    # is created and before it switches to WAL
+    conn.execute("PRAGMA page_size=4096")
+    conn.execute("PRAGMA journal_mode=WAL")
     conn.execute('''
         CREATE TABLE IF NOT EXISTS tracks (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -35,32 +97,97 @@ def init_db():
             artist TEXT NOT NULL
         )
     ''')
+    # Single-row counter bumped on every change to 'tracks', so caches can
+    # notice writes made by other processes (the recognition service's
+    # track map, the test suites).
+    conn.executescript('''
+        CREATE TABLE IF NOT EXISTS catalog_version (
+            id INTEGER PRIMARY KEY CHECK (id = 0),
+            version INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO catalog_version (id, version) VALUES (0, 0);
+        CREATE TRIGGER IF NOT EXISTS tracks_version_insert AFTER INSERT ON tracks
+        BEGIN UPDATE catalog_version SET version = version + 1; END;
+        CREATE TRIGGER IF NOT EXISTS tracks_version_update AFTER UPDATE ON tracks
+        BEGIN UPDATE catalog_version SET version = version + 1; END;
+        CREATE TRIGGER IF NOT EXISTS tracks_version_delete AFTER DELETE ON tracks
+        BEGIN UPDATE catalog_version SET version = version + 1; END;
+    ''')
     conn.commit()
     conn.close()
 
+def _parse_track(data):
+    """
+    Validates one track object from a request body.
+    Returns the stripped (title, artist) pair, or raises ValueError with
+    the message to send back in the 400 response.
+    """
+    try:
+        title = data["title"]
+        artist = data["artist"]
+    except (KeyError, TypeError):
+        raise ValueError("Missing title or artist") from None
+
+    if not (isinstance(title, str) and isinstance(artist, str)
+            and _NON_BLANK.search(title) and _NON_BLANK.search(artist)):
+        raise ValueError("Invalid title or artist")
+    return title.strip(), artist.strip()
+
 @app.route("/catalog/tracks", methods=["POST"])
 def add_track():
     """
     S1: Add a new track to the catalogue.
     Expects JSON: { "title": "...", "artist": "..." }
+    or a JSON array of such objects to add several tracks in one transaction.
     Returns 201 Created on success, 400 if bad data.
     """
-    data = request.get_json()
-    if not data or "title" not in data or "artist" not in data:
-        return jsonify({"message": "Missing title or artist"}), 400
+    data = request.get_json(silent=True, cache=False)
+    if data is None:
+        return ojson({"message": "Request body must be JSON"}, 400)
+    if isinstance(data, list):
+        return _add_tracks(data)
+
+    try:
+        title, artist = _parse_track(data)
+    except ValueError as e:
+        return ojson({"message": str(e)}, 400)
+
+    # Autocommit connection: the INSERT is its own transaction
+    db = get_db()
+    db.execute(_SQL_INSERT, (title, artist))
+    _invalidate_list_cache()
     
-    title = data["title"].strip()
-    artist = data["artist"].strip()
-    if not title or not artist:
-        return jsonify({"message": "Invalid title or artist"}), 400
+    return ojson({"message": "Track created successfully"}, 201)
+
+def _add_tracks(items):
+    """
+    Batch form of S1: inserts every track in 'items' with a single commit.
+    Returns 201 with the new ids, or 400 (inserting nothing) if any is invalid.
+    """
+    if not items:
+        return ojson({"message": "No tracks supplied"}, 400)
+
+    try:
+        rows = [_parse_track(item) for item in items]
+    except ValueError as e:
+        return ojson({"message": str(e)}, 400)
 
     db = get_db()
     cursor = db.cursor()
-    cursor.execute("INSERT INTO tracks (title, artist) VALUES (?, ?)",
-                   (title, artist))
-    db.commit()
-    
-    return jsonify({"message": "Track created successfully"}), 201
+    # Take the write lock up front so the batch can't fail half-way on a
+    # read-to-write lock upgrade
+    cursor.execute("BEGIN IMMEDIATE")
+    cursor.executemany(_SQL_INSERT, rows)
+    # AUTOINCREMENT ids are contiguous within a single write transaction
+    last_id = cursor.execute("SELECT last_insert_rowid()").fetchone()[0]
+    cursor.execute("COMMIT")
+    _invalidate_list_cache()
+
+    return ojson({
+        "message": "Tracks created successfully",
+        "inserted": len(rows),
+        "ids": list(range(last_id - len(rows) + 1, last_id + 1))
+    }, 201)
 
 @app.route("/catalog/tracks/<int:track_id>", methods=["DELETE"])
 def remove_track(track_id):
@@ -69,41 +196,60 @@ def remove_track(track_id):
     Returns 200 OK on success, 404 if track not found.
     """
     db = get_db()
-    cursor = db.cursor()
-    
-    # Check if track exists
-    cursor.execute("SELECT id FROM tracks WHERE id = ?", (track_id,))
-    row = cursor.fetchone()
-    if not row:
-        return jsonify({"message": "Track not found"}), 404
-    
-    # Delete if found
-    cursor.execute("DELETE FROM tracks WHERE id = ?", (track_id,))
-    db.commit()
-    return jsonify({"message": "Track removed successfully"}), 200
+
+    # Delete and check existence in one statement
+    cursor = db.execute(_SQL_DELETE, (track_id,))
+    if cursor.rowcount == 0:
+        return ojson({"message": "Track not found"}, 404)
+
+    _invalidate_list_cache()
+    return ojson({"message": "Track removed successfully"}, 200)
 
 @app.route("/catalog/tracks", methods=["GET"])
 def list_tracks():
     """
     S3: Return a list of tracks in the catalogue.
     Returns 200 OK with JSON: { "tracks": [ { id, title, artist }, ... ] }
+    The response carries an ETag, plus Last-Modified once the list is at
+    least a second old; a matching If-None-Match, or an If-Modified-Since
+    no older than Last-Modified, gives 304.
     """
     db = get_db()
     cursor = db.cursor()
-    cursor.execute("SELECT id, title, artist FROM tracks")
-    rows = cursor.fetchall()
-
-    tracks = []
-    for row in rows:
-        tracks.append({
-            "id":     row["id"],
-            "title":  row["title"],
-            "artist": row["artist"]
-        })
-    
-    return jsonify({"tracks": tracks}), 200
+    cursor.execute(_SQL_VERSION)
+    version = cursor.fetchone()[0]
+
+    with _LIST_LOCK:
+        if _LIST_CACHE["body"] is None or _LIST_CACHE["version"] != version:
+            # Encode straight from the cursor, without a fetchall() copy
+            cursor.execute(_SQL_LIST)
+            body = orjson.dumps({"tracks": [
+                {"id": row[0], "title": row[1], "artist": row[2]}
+                for row in cursor
+            ]})
+            _LIST_CACHE["version"] = version
+            _LIST_CACHE["etag"] = hashlib.blake2b(body, digest_size=8).hexdigest()
+            # HTTP dates have whole-second resolution
+            _LIST_CACHE["last_modified"] = datetime.now(timezone.utc).replace(microsecond=0)
+            _LIST_CACHE["body"] = body
+        body, etag = _LIST_CACHE["body"], _LIST_CACHE["etag"]
+        last_modified = _LIST_CACHE["last_modified"]
+
+    rsp = app.response_class(body, status=200, mimetype="application/json")
+    rsp.set_etag(etag)
+    # Another change could still land within the rebuild's second and keep
+    # the same date, so the date is only sent (and If-Modified-Since only
+    # honoured) once that second has passed; until then the ETag decides.
+    if last_modified < datetime.now(timezone.utc).replace(microsecond=0):
+        rsp.last_modified = last_modified
+    return rsp.make_conditional(request)
 
 
 if __name__ == "__main__":
     init_db()
-    app.run(port=5000, debug=True)
+    if os.getenv("FLASK_DEBUG"):
+        app.run(port=5000, debug=True)
+    else:
+        # One worker thread per pooled connection
+        from waitress import serve
+        serve(app, host="127.0.0.1", port=5000, threads=POOL_SIZE)
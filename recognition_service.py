@@ -3,29 +3,143 @@ Implements one endpoint:
   1. POST /recognition  (S4) Recognize a music fragment using Audd.io
 """
 
+import hashlib
+import logging
 import os
+import queue
+import threading
+import time
+import orjson
 import requests
 import sqlite3
-from flask import Flask, request, jsonify, g
+from collections import OrderedDict
+from flask import Flask, request, g
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 app = Flask(__name__)
+app.json.compact = True  # for anything still going through jsonify
+log = logging.getLogger(__name__)
 DATABASE = 'shamzam.db'
+POOL_SIZE = 8
+MMAP_SIZE = 256 * 1024 * 1024  # read the DB file through mmap, up to 256 MiB
+RECOGNITION_CACHE_SIZE = 512
+NOT_RECOGNIZED_TTL = 60  # seconds
+
+_SQL_VERSION = "SELECT version FROM catalog_version"
+_SQL_TRACKS = "SELECT id, title, artist FROM tracks ORDER BY id"
 
 # Replace with your Audd.io API key or load from environment:
 AUDD_API_KEY = os.getenv("AUDD_KEY", "your_key")
 
+# One keep-alive session for all Audd.io calls, so only the first request
+# pays for the TCP and TLS handshakes. POSTs are retried on failed connects
+# and gateway error responses, never after a read error or timeout (read=0):
+# that would resend a request Audd.io may already be processing, stretching
+# the 15s budget and spending more of the metered quota.
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=32,
+    max_retries=Retry(total=2, read=0, backoff_factor=0.2,
+                      status_forcelist=(502, 503, 504),
+                      allowed_methods=frozenset({"POST"})),
+))
+
+# Bounded pool of SQLite connections shared by all request threads.
+# Each slot starts as None and is connected on first use.
+_POOL = queue.Queue()
+for _ in range(POOL_SIZE):
+    _POOL.put(None)
+
+# Audd.io results keyed by the SHA-256 (hex) of the uploaded bytes, in LRU order.
+# Values are (expires_at, (title, artist)); fragments Audd.io couldn't
+# recognise are stored as (expires_at, None) for NOT_RECOGNIZED_TTL only.
+_RECOGNITION_CACHE = OrderedDict()
+_RECOGNITION_LOCK = threading.Lock()
+_MISS = object()
+
+def _cache_lookup(key):
+    """Returns the cached (title, artist) or None for key, or _MISS."""
+    with _RECOGNITION_LOCK:
+        entry = _RECOGNITION_CACHE.get(key)
+        if entry is None:
+            return _MISS
+        expires_at, recognized = entry
+        if expires_at is not None and expires_at < time.monotonic():
+            del _RECOGNITION_CACHE[key]
+            return _MISS
+        _RECOGNITION_CACHE.move_to_end(key)
+        return recognized
+
+def _cache_store(key, recognized):
+    """Caches an Audd.io result, evicting the least recently used entries."""
+    expires_at = None
+    if recognized is None:
+        expires_at = time.monotonic() + NOT_RECOGNIZED_TTL
+    with _RECOGNITION_LOCK:
+        _RECOGNITION_CACHE[key] = (expires_at, recognized)
+        _RECOGNITION_CACHE.move_to_end(key)
+        while len(_RECOGNITION_CACHE) > RECOGNITION_CACHE_SIZE:
+            _RECOGNITION_CACHE.popitem(last=False)
+
+# The catalogue as {(title, artist) casefolded: (id, title, artist)}. The
+# catalogue service runs in another process, so the map is rebuilt whenever
+# the trigger-maintained catalog_version differs from the one it was built at.
+_TRACK_MAP = {}
+_TRACK_MAP_VERSION = None
+_TRACK_MAP_LOCK = threading.Lock()
+
+def get_track_map(db):
+    """Returns the in-memory track map, reloading it if the catalogue changed."""
+    global _TRACK_MAP, _TRACK_MAP_VERSION
+    version = db.execute(_SQL_VERSION).fetchone()[0]
+    with _TRACK_MAP_LOCK:
+        if version != _TRACK_MAP_VERSION:
+            track_map = {}
+            for track_id, title, artist in db.execute(_SQL_TRACKS):
+                # Oldest track wins on duplicates
+                track_map.setdefault((title.casefold(), artist.casefold()),
+                                     (track_id, title, artist))
+            _TRACK_MAP, _TRACK_MAP_VERSION = track_map, version
+        return _TRACK_MAP
+
+def ojson(obj, status=200):
+    """Builds a JSON response with orjson, which is much faster than jsonify."""
+    return app.response_class(orjson.dumps(obj), status=status,
+                              mimetype="application/json")
+
+def _connect():
+    """Opens a pooled connection in autocommit mode with WAL enabled."""
+    conn = sqlite3.connect(DATABASE, check_same_thread=False,
+                           isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-20000")
+    conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+    return conn
+
 def get_db():
-    """Returns a SQLite connection, stored in Flask’s 'g' context."""
+    """Returns a pooled SQLite connection, stored in Flask’s 'g' context."""
     if 'db_conn' not in g:
-        g.db_conn = sqlite3.connect(DATABASE)
-        g.db_conn.row_factory = sqlite3.Row
+        conn = _POOL.get()
+        if conn is None:
+            try:
+                conn = _connect()
+            except sqlite3.Error:
+                _POOL.put(None)
+                raise
+        g.db_conn = conn
     return g.db_conn
 
 @app.teardown_appcontext
 def close_db(exception):
     db_conn = g.pop('db_conn', None)
     if db_conn is not None:
-        db_conn.close()
+        if db_conn.in_transaction:
+            db_conn.rollback()
+        _POOL.put(db_conn)
 
 @app.route("/recognition", methods=["POST"])
 def recognize_fragment():
@@ -33,73 +147,98 @@ def recognize_fragment():
     S4: Convert an audio fragment to a known track in the catalogue.
     Expects a file upload in form-data with key 'file'.
 
+    Clients may also send the fragment's SHA-256 (hex) in an X-Audio-SHA256
+    header. If that hash has already been recognized, the cached result is
+    used and the upload is not read at all.
+
     Workflow:
-      1) Send fragment to Audd.io
+      1) Send fragment to Audd.io (skipped if the same bytes were seen before)
       2) Compare recognized title/artist with local DB
       3) Return match if found, else 404
     """
-    if 'file' not in request.files:
-        return jsonify({"message": "No file part in the request"}), 400
-
-    audio_file = request.files['file']
-    if audio_file.filename == '':
-        return jsonify({"message": "No file selected"}), 400
-
-    # Send file to Audd.io
-    url = "https://api.audd.io/"
-    data = {
-        "api_token": AUDD_API_KEY,
-        "return": "apple_music,spotify"  # example of additional data
-    }
-    files = {
-        "file": (audio_file.filename, audio_file, audio_file.content_type)
-    }
-
-    try:
-        response = requests.post(url, data=data, files=files, timeout=15)
-        response.raise_for_status()
-    except requests.RequestException as e:
-        return jsonify({"message": f"Error calling Audd.io: {str(e)}"}), 500
-
-    result = response.json()
-    print("DEBUG Audd.io response:", result)
-    if result.get("status") == "success":
-        recognized = result.get("result", {})
-        if recognized is not None:
-            recognized_title = recognized.get("title")
-            recognized_artist = recognized.get("artist")
-
-            # Now see if we have this track in our 'tracks' table
-            db = get_db()
-            cursor = db.cursor()
-            # Simple approach: see if there's an exact match
-            cursor.execute("""
-                SELECT id, title, artist
-                FROM tracks
-                WHERE LOWER(title) = LOWER(?)
-                AND LOWER(artist) = LOWER(?)
-                """, (recognized_title, recognized_artist))
-            row = cursor.fetchone()
-
-            if row:
-                # We found a match
-                return jsonify({
-                    "trackId": row["id"],
-                    "title": row["title"],
-                    "artist": row["artist"]
-                }), 200
-            else:
-                # Not found in our local catalogue
-                return jsonify({"message": "No matching track in catalogue"}), 404
-        else:
-            # Snippet not recognized by Aaud.io
-            return jsonify({"message": "Track not recognized"}), 404
-    else:
-        # Likely invalid Aaud.io key
-        return jsonify({"message": result.get("error").get("error_message")}), 404
+    key = request.headers.get("X-Audio-SHA256", "").strip().lower()
+    recognized = _cache_lookup(key) if key else _MISS
 
+    if recognized is _MISS:
+        if 'file' not in request.files:
+            return ojson({"message": "No file part in the request"}, 400)
+
+        audio_file = request.files['file']
+        if audio_file.filename == '':
+            return ojson({"message": "No file selected"}, 400)
+
+        # Hash the upload in chunks from werkzeug's spooled stream instead of
+        # reading it into a separate buffer first (requests still buffers
+        # the whole file once when it builds the multipart body)
+        stream = audio_file.stream
+        digest = hashlib.sha256()
+        for chunk in iter(lambda: stream.read(65536), b""):
+            digest.update(chunk)
+        key = digest.hexdigest()
+        recognized = _cache_lookup(key)
+
+    if recognized is _MISS:
+        # Send file to Audd.io
+        url = "https://api.audd.io/"
+        data = {
+            "api_token": AUDD_API_KEY,
+            "return": "apple_music,spotify"  # example of additional data
+        }
+        stream.seek(0)
+        files = {
+            "file": (audio_file.filename, stream, audio_file.content_type)
+        }
+
+        try:
+            response = _SESSION.post(url, data=data, files=files, timeout=15)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            return ojson({"message": f"Error calling Audd.io: {str(e)}"}, 500)
+
+        result = response.json()
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Audd.io response: %r", result)
+        if result.get("status") != "success":
+            # Likely invalid Aaud.io key
+            return ojson({"message": result.get("error").get("error_message")}, 404)
+
+        match = result.get("result", {})
+        recognized = None if match is None else (match.get("title"), match.get("artist"))
+        _cache_store(key, recognized)
+
+    if recognized is None:
+        # Snippet not recognized by Aaud.io
+        return ojson({"message": "Track not recognized"}, 404)
+
+    recognized_title, recognized_artist = recognized
+
+    # Now see if we have this track in our catalogue
+    # Simple approach: see if there's an exact (case-insensitive) match
+    row = None
+    if recognized_title and recognized_artist:
+        track_map = get_track_map(get_db())
+        row = track_map.get((recognized_title.casefold(),
+                             recognized_artist.casefold()))
+
+    if row:
+        # We found a match
+        track_id, title, artist = row
+        return ojson({
+            "trackId": track_id,
+            "title": title,
+            "artist": artist
+        }, 200)
+    else:
+        # Not found in our local catalogue
+        return ojson({"message": "No matching track in catalogue"}, 404)
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.DEBUG if os.getenv("FLASK_DEBUG") else logging.INFO)
     # This service assumes the same DB schema as 'catalog_service.py'.
     # Make sure 'shamzam.db' and its 'tracks' table are already created.
-    app.run(port=6000, debug=True)
+    if os.getenv("FLASK_DEBUG"):
+        app.run(port=6000, debug=True)
+    else:
+        # One worker thread per pooled connection
+        from waitress import serve
+        serve(app, host="127.0.0.1", port=6000, threads=POOL_SIZE)
@@ -2,6 +2,8 @@ import unittest
 import requests
 import sqlite3
 import os
+import time
+from email.utils import parsedate_to_datetime
 
 class TestShamzamCatalogue(unittest.TestCase):
     """
@@ -74,6 +76,55 @@ class TestShamzamCatalogue(unittest.TestCase):
         rsp  = requests.post(self.base_url, json=data)
         self.assertEqual(rsp.status_code, 400)
 
+    def test_s1_unhappy_non_json_body(self):
+        """
+        Body that isn't JSON -> Expect 400 Bad Request
+        """
+        rsp = requests.post(self.base_url, data="x")
+        self.assertEqual(rsp.status_code, 400)
+        self.assertEqual(rsp.json()["message"], "Request body must be JSON")
+
+    def test_s1_unhappy_non_string_title(self):
+        """
+        Title that isn't a string -> Expect 400 Bad Request
+        """
+        data = {"title": 1, "artist": "Oasis"}
+        rsp  = requests.post(self.base_url, json=data)
+        self.assertEqual(rsp.status_code, 400)
+        self.assertEqual(rsp.json()["message"], "Invalid title or artist")
+
+    def test_s1_add_tracks_in_batch(self):
+        """
+        Posting a JSON array adds every track in one request.
+        Expect 201 Created with the ids the tracks were stored under, in order.
+        """
+        data = [
+            {"title": "Song A", "artist": "Artist A"},
+            {"title": "Song B", "artist": "Artist B"},
+        ]
+        rsp = requests.post(self.base_url, json=data)
+        self.assertEqual(rsp.status_code, 201)
+        self.assertEqual(rsp.json()["inserted"], 2)
+
+        rsp_list = requests.get(self.base_url)
+        self.assertEqual(rsp_list.status_code, 200)
+        stored_ids = {t["title"]: t["id"] for t in rsp_list.json()["tracks"]}
+        self.assertEqual(rsp.json()["ids"], [stored_ids["Song A"], stored_ids["Song B"]])
+
+    def test_s1_unhappy_batch_with_invalid_track(self):
+        """
+        One invalid element in a batch -> Expect 400 and nothing inserted.
+        """
+        data = [
+            {"title": "Song A", "artist": "Artist A"},
+            {"title": "", "artist": "Artist B"},
+        ]
+        rsp = requests.post(self.base_url, json=data)
+        self.assertEqual(rsp.status_code, 400)
+
+        rsp_list = requests.get(self.base_url)
+        self.assertEqual(rsp_list.json()["tracks"], [])
+
     ########################################################################
     # S2: Remove a track
     ########################################################################
@@ -180,6 +231,81 @@ class TestShamzamCatalogue(unittest.TestCase):
             )
             self.assertTrue(found, f"Track {expected} not found in returned list.")
 
+    def test_s3_conditional_get_not_modified(self):
+        """
+        Re-fetching the list with the ETag from a previous response
+        -> Expect 304 Not Modified while the catalogue is unchanged.
+        """
+        rsp_add = requests.post(self.base_url, json={"title": "Song A", "artist": "Artist A"})
+        self.assertEqual(rsp_add.status_code, 201)
+
+        rsp = requests.get(self.base_url)
+        self.assertEqual(rsp.status_code, 200)
+        etag = rsp.headers.get("ETag")
+        self.assertIsNotNone(etag, "Response is missing an ETag header.")
+
+        rsp_again = requests.get(self.base_url, headers={"If-None-Match": etag})
+        self.assertEqual(rsp_again.status_code, 304)
+
+    def test_s3_if_modified_since_not_modified(self):
+        """
+        Re-fetching the list with its Last-Modified date as If-Modified-Since
+        -> Expect 304 Not Modified while the catalogue is unchanged.
+        """
+        rsp_add = requests.post(self.base_url, json={"title": "Song A", "artist": "Artist A"})
+        self.assertEqual(rsp_add.status_code, 201)
+
+        # Last-Modified is only sent once the list is at least a second old
+        requests.get(self.base_url)
+        time.sleep(1.1)
+        rsp = requests.get(self.base_url)
+        self.assertEqual(rsp.status_code, 200)
+        last_modified = rsp.headers.get("Last-Modified")
+        self.assertIsNotNone(last_modified, "Response is missing a Last-Modified header.")
+
+        rsp_again = requests.get(self.base_url, headers={"If-Modified-Since": last_modified})
+        self.assertEqual(rsp_again.status_code, 304)
+
+    def test_s3_if_modified_since_after_change(self):
+        """
+        Adding a track straight after a GET, then re-fetching with only that
+        GET's Last-Modified as If-Modified-Since
+        -> Expect 200 with the new track, even within the same second.
+        """
+        requests.get(self.base_url)
+        time.sleep(1.1)
+        rsp = requests.get(self.base_url)
+        self.assertEqual(rsp.status_code, 200)
+        last_modified = rsp.headers.get("Last-Modified")
+        self.assertIsNotNone(last_modified, "Response is missing a Last-Modified header.")
+
+        rsp_add = requests.post(self.base_url, json={"title": "Song A", "artist": "Artist A"})
+        self.assertEqual(rsp_add.status_code, 201)
+
+        rsp_again = requests.get(self.base_url, headers={"If-Modified-Since": last_modified})
+        self.assertEqual(rsp_again.status_code, 200)
+        self.assertEqual(len(rsp_again.json()["tracks"]), 1)
+
+    def test_s3_last_modified_not_after_date(self):
+        """
+        Many adds and lists in quick succession, then one more list a second
+        later -> Last-Modified, whenever sent, is never later than Date.
+        """
+        responses = []
+        for i in range(20):
+            rsp_add = requests.post(self.base_url, json={"title": f"Song {i}", "artist": "Artist"})
+            self.assertEqual(rsp_add.status_code, 201)
+            responses.append(requests.get(self.base_url))
+        time.sleep(1.1)
+        responses.append(requests.get(self.base_url))
+        self.assertIn("Last-Modified", responses[-1].headers)
+
+        for rsp in responses:
+            self.assertEqual(rsp.status_code, 200)
+            if "Last-Modified" in rsp.headers:
+                self.assertLessEqual(parsedate_to_datetime(rsp.headers["Last-Modified"]),
+                                     parsedate_to_datetime(rsp.headers["Date"]))
+
     def test_s3_unhappy_method_not_allowed(self):
         """
         Unhappy Path #1 for S3:
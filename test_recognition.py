@@ -1,6 +1,7 @@
 import unittest
 import requests
 import sqlite3
+import hashlib
 import os
 import time
 
@@ -66,6 +67,27 @@ class TestShamzamRecognition(unittest.TestCase):
         self.assertEqual(data["title"], "Blinding Lights")
         self.assertEqual(data["artist"], "The Weeknd")
 
+    def test_s4_repeat_with_hash_header(self):
+        """
+        1) Recognize 'Blinding Lights' once with a normal upload.
+        2) Repeat with only its SHA-256 in the X-Audio-SHA256 header, no file.
+        3) Expect the same 200 answer, served from the recognition cache.
+        """
+        fragment_file = '_Blinding Lights.wav'
+        if not os.path.exists(fragment_file):
+            self.skipTest(f"Skipping test: sample file '{fragment_file}' not found.")
+
+        with open(fragment_file, "rb") as f:
+            content = f.read()
+        files = {"file": (fragment_file, content, "audio/wav")}
+        rsp   = requests.post(self.recognition_url, files=files)
+        self.assertEqual(rsp.status_code, 200, f"Expected 200, got {rsp.status_code}")
+
+        headers = {"X-Audio-SHA256": hashlib.sha256(content).hexdigest()}
+        rsp_cached = requests.post(self.recognition_url, headers=headers)
+        self.assertEqual(rsp_cached.status_code, 200)
+        self.assertEqual(rsp_cached.json()["title"], "Blinding Lights")
+
     ########################################################################
     # S4: Unhappy Path #1: Missing file in request
     ########################################################################